@@ -18,17 +18,15 @@ import re
 import subprocess
 import sys
 import time
+import uuid
 import warnings
 
 # ----------------------------
 # Imports for other modules --
 # ----------------------------
 
-from keystoneauth1 import loading
-from keystoneauth1 import session
-from novaclient import client
-import glanceclient
-import novaclient.exceptions
+# Openstack clients are imported where they are used, importing them takes
+# a noticeable time which is useless for command line parsing
 
 # ---------------------------------
 # Local non-exported definitions --
@@ -37,6 +35,26 @@ import novaclient.exceptions
 _OPENSTACK_API_VERSION = '2'
 _OPENSTACK_VERIFY_SSL = False
 
+# Bounds for delay between two polls of cloud-init status, in seconds
+_CLOUD_CONFIG_POLL_MIN_DELAY = 2
+_CLOUD_CONFIG_POLL_MAX_DELAY = 15
+
+def _ssh_cmd(host, command):
+    """
+    Return ssh command line running command on host.
+    A pseudo-terminal is forced (required by sudo 'requiretty'),
+    without using the local terminal, as ssh commands run in parallel
+    """
+    return ['ssh', '-tt', '-F', './ssh_config', host, command]
+
+def _check_ssh_output(cmd):
+    """
+    Run ssh command line with stdin redirected from /dev/null,
+    so that concurrent ssh processes do not change local terminal mode
+    """
+    with open(os.devnull, 'r') as devnull:
+        return subprocess.check_output(cmd, stdin=devnull)
+
 def _get_nova_creds():
     """
     Extract the login information from the environment
@@ -88,7 +106,7 @@ def config_logger(loggerName, verbose, verboseAll):
     if not verboseAll:
         # suppress INFO/DEBUG regular messages from other loggers
         # Disable dependencies loggers and warnings
-        for logger_name in ["keystoneauth", "novaclient", "requests", "stevedore", "urllib3"]:
+        for logger_name in ["keystoneauth", "neutronclient", "novaclient", "requests", "stevedore", "urllib3"]:
             logging.getLogger(logger_name).setLevel(logging.ERROR)
         warnings.filterwarnings("ignore")
 
@@ -110,6 +128,11 @@ class CloudManager(object):
         @param add_ssh_key Add ssh key only while launching instances in provision qserv.
         """
 
+        from neutronclient.v2_0 import client as neutron_client
+        from novaclient import client
+        import glanceclient
+        import novaclient.exceptions
+
         logging.debug("Use configuration file: %s", config_file_name)
 
         self._creds = _get_nova_creds()
@@ -128,7 +151,10 @@ class CloudManager(object):
 
         self._session = self._create_keystone_session()
 
+        # All clients share the same session, and thus the same token
         self.nova = client.Client(_OPENSTACK_API_VERSION, session=self._session)
+        self.neutron = neutron_client.Client(session=self._session)
+        self.glance = glanceclient.Client(_OPENSTACK_API_VERSION, session=self._session)
         base_image_name = config.get('openstack', used_image_key)
         self.snapshot_name = config.get('openstack', 'snapshot_name')
         try:
@@ -178,9 +204,15 @@ class CloudManager(object):
         Return a keystone session used to
         connect to other Openstack services
         """
+        from keystoneauth1 import loading
+        from keystoneauth1 import session
+
         loader = loading.get_plugin_loader('password')
         auth = loader.load_from_options(**self._creds)
         sess = session.Session(auth=auth, verify=_OPENSTACK_VERIFY_SSL)
+        # Authenticate once here, the token is then cached by the session
+        # and avoids concurrent authentications from parallel API calls
+        sess.get_token()
         return sess
 
     def get_safe_username(self):
@@ -211,6 +243,8 @@ class CloudManager(object):
         Returns and Openstack image named self.snapshot_name. Exit with error code if image is not unique.
         @throw novaclient.exceptions.NoUniqueMatch if image is not unique.
         """
+        import novaclient.exceptions
+
         try:
             snapshot = self.nova.images.find(name=self.snapshot_name)
         except novaclient.exceptions.NotFound:
@@ -225,8 +259,7 @@ class CloudManager(object):
         Delete an Openstack image from Glance
         :param snapshot: image to delete
         """
-        glance = glanceclient.Client(_OPENSTACK_API_VERSION, session=self._session)
-        glance.images.delete(snapshot.id)
+        self.glance.images.delete(snapshot.id)
 
     def _build_instance_name(self, instance_id):
         """
@@ -254,6 +287,58 @@ class CloudManager(object):
                                             userdata=userdata,
                                             key_name=self.key,
                                             nics=self.nics)
+        self._wait_active(instance)
+
+        return instance
+
+    def nova_servers_create_bulk(self, instance_ids, userdata):
+        """
+        Boot several instances sharing the same userdata with a single
+        API call, and returns them when their status is "ACTIVE"
+
+        Instances are booted with a unique temporary name, and renamed
+        afterwards with instance_ids. Their guest hostname keeps the
+        temporary name, it is set by update_instance_etc_hosts().
+
+        @param instance_ids: ids used to build instances names
+        """
+        count = len(instance_ids)
+        boot_name = self._build_instance_name('boot-' + uuid.uuid4().hex[:8])
+        logging.info("Launch %s instances", count)
+
+        # Launch all instances from an image, in a single request,
+        # Nova appends '-<index>' to boot_name if count > 1
+        self.nova.servers.create(name=boot_name,
+                                 image=self.image,
+                                 flavor=self.flavor,
+                                 userdata=userdata,
+                                 key_name=self.key,
+                                 nics=self.nics,
+                                 min_count=count,
+                                 max_count=count)
+
+        # Poll at 5 second intervals, with a single request for all
+        # instances, until their status is 'ACTIVE'
+        search_opts = {'name': '^' + boot_name}
+        instances = self.nova.servers.list(search_opts=search_opts)
+        while (len(instances) < count or
+               any(instance.status != 'ACTIVE' for instance in instances)):
+            time.sleep(5)
+            instances = self.nova.servers.list(search_opts=search_opts)
+        logging.info("%s instances are active", count)
+
+        # Sort instances by launch index
+        instances.sort(key=lambda instance: (len(instance.name), instance.name))
+        for instance, instance_id in zip(instances, instance_ids):
+            instance.update(name=self._build_instance_name(instance_id))
+            instance.get()
+
+        return instances
+
+    def _wait_active(self, instance):
+        """
+        Returns when instance status is "ACTIVE"
+        """
         # Poll at 5 second intervals, until the status is 'ACTIVE'
         status = instance.status
         while status != 'ACTIVE':
@@ -261,9 +346,7 @@ class CloudManager(object):
             instance.get()
             status = instance.status
         logging.info("status: %s", status)
-        logging.info("Instance %s is active", instance_name)
-
-        return instance
+        logging.info("Instance %s is active", instance.name)
 
     def detect_end_cloud_config(self, instance):
         """
@@ -271,29 +354,54 @@ class CloudManager(object):
         """
         check_word = "---SYSTEM READY FOR SNAPSHOT---"
         end_word = None
+        delay = _CLOUD_CONFIG_POLL_MIN_DELAY
         while not end_word:
-            time.sleep(10)
+            time.sleep(delay)
+            # Exponential backoff, cloud-init might take several minutes
+            delay = min(delay * 1.5, _CLOUD_CONFIG_POLL_MAX_DELAY)
             output = instance.get_console_output()
             logging.debug("console output: %s", output)
             logging.debug("instance: %s",instance)
             end_word = re.search(check_word, output)
 
-    def nova_servers_cleanup(self, last_instance_id):
+    def nova_servers_cleanup(self, last_instance_id, release_floating_ips=False,
+                             keep_floating_ips=0):
         """
         Shut down and delete all Qserv servers
         belonging to current Openstack user.
 
         Raise exception if instance name prefix is empty.
+
+        @param release_floating_ips: also deallocate floating ip addresses
+                                     attached to deleted servers
+        @param keep_floating_ips:    number of floating ip addresses attached
+                                     to deleted servers which are not deallocated,
+                                     so that they can be reused
         """
         if not self._hostname_tpl:
             raise ValueError("Instance prefix is empty")
+        floating_ips = []
+        if release_floating_ips:
+            floating_ips = self._list_project_floating_ips()
+        nb_kept = 0
         for server in self.nova.servers.list():
             # server_name must be ascii
             if server.name.startswith(self._hostname_tpl):
                 logging.debug("Cleanup existing instance %s", server.name)
+                if floating_ips:
+                    ports = self.neutron.list_ports(device_id=server.id)['ports']
+                    port_ids = set(port['id'] for port in ports)
+                    for floating_ip in floating_ips:
+                        if floating_ip['port_id'] not in port_ids:
+                            continue
+                        if nb_kept < keep_floating_ips:
+                            logging.debug("Keep floating ip %s for reuse",
+                                          floating_ip['floating_ip_address'])
+                            nb_kept += 1
+                        else:
+                            self.release_floating_ip(floating_ip)
                 server.delete()
 
-
     def _manage_ssh_key(self):
         """
         Upload user ssh public key on Openstack instances
@@ -306,32 +414,62 @@ class CloudManager(object):
         with open(os.path.expanduser(self.key_filename + ".pub")) as fpubkey:
             self.nova.keypairs.create(name=self.key, public_key=fpubkey.read())
 
-    def get_floating_ip(self):
+    def get_floating_ip(self, instance):
         """
-        Return an available floating ip address
+        Associate a floating ip address to an instance and return it,
+        unassociated floating ip addresses of the project are reused
+        before allocating a new one from the external network
+
+        @throw neutronclient.common.exceptions.NeutronClientException
+               if floating ip association fails
         """
-        floating_ips = self.nova.floating_ips.list()
-        floating_ip = None
-        floating_ip_pool = self.nova.floating_ip_pools.list()[0].name
+        import neutronclient.common.exceptions
+
+        ports = self.neutron.list_ports(device_id=instance.id)['ports']
+        if not ports:
+            logging.critical("No network port found for instance %s", instance.name)
+            sys.exit(1)
+        body = {'floatingip': {'port_id': ports[0]['id']}}
 
         # Check for available public ip address in project
-        for ip in floating_ips:
-            if ip.instance_id is None:
-                floating_ip = ip
-                logging.debug('Available floating ip found %s', floating_ip)
-                break
-
-        # Check for available public ip address in ext-net pool
-        if floating_ip is None:
-            try:
-                logging.debug("Use floating ip pool: %s", floating_ip_pool)
-                floating_ip = self.nova.floating_ips.create(floating_ip_pool)
-            except novaclient.exceptions.Forbidden as exc:
-                logging.fatal("Unable to retrieve public IP: %s", exc)
+        for floating_ip in self._list_project_floating_ips():
+            if floating_ip['port_id'] is None:
+                logging.debug('Available floating ip found %s',
+                              floating_ip['floating_ip_address'])
+                return self.neutron.update_floatingip(floating_ip['id'], body)['floatingip']
+
+        # Allocate public ip address in external network
+        try:
+            ext_nets = self.neutron.list_networks(**{'router:external': True})['networks']
+            if not ext_nets:
+                logging.critical("No external network available for public IP")
                 sys.exit(1)
+            ext_net = ext_nets[0]
+            logging.debug("Use external network: %s", ext_net['name'])
+            body['floatingip']['floating_network_id'] = ext_net['id']
+            floating_ip = self.neutron.create_floatingip(body)['floatingip']
+        except (neutronclient.common.exceptions.Forbidden,
+                neutronclient.common.exceptions.OverQuotaClient) as exc:
+            logging.fatal("Unable to retrieve public IP: %s", exc)
+            sys.exit(1)
 
         return floating_ip
 
+    def _list_project_floating_ips(self):
+        """
+        Return floating ip addresses of current project only,
+        admin credentials give access to other projects ones
+        """
+        project_id = self._session.get_project_id()
+        return self.neutron.list_floatingips(project_id=project_id)['floatingips']
+
+    def release_floating_ip(self, floating_ip):
+        """
+        Deallocate a floating ip address from the project
+        """
+        logging.info("Release floating ip %s", floating_ip['floating_ip_address'])
+        self.neutron.delete_floatingip(floating_ip['id'])
+
     def print_ssh_config(self, instances, floating_ip):
         """
         Print ssh client configuration to local file
@@ -355,7 +493,7 @@ class CloudManager(object):
             fixed_ip = instance.networks[self.network_name][0]
             ssh_config_extract += ssh_config_tpl.format(host=instance.name,
                                                         fixed_ip=fixed_ip,
-                                                        floating_ip=floating_ip.ip,
+                                                        floating_ip=floating_ip['floating_ip_address'],
                                                         key_filename=self.key_filename)
         logging.debug("Create SSH client config ")
 
@@ -363,31 +501,29 @@ class CloudManager(object):
         f.write(ssh_config_extract)
         f.close()
 
-    def check_ssh_up(self, instances):
+    def check_instance_ssh_up(self, instance):
         """
-        Check if the ssh service started on all instances
+        Check if the ssh service started on a given instance
         """
-        for instance in instances:
-            cmd = ['ssh', '-t', '-F', './ssh_config', instance.name, 'true']
-            success = False
-            nb_try = 0
-            while not success:
-                try:
-                    subprocess.check_output(cmd)
-                    success = True
-                except subprocess.CalledProcessError as exc:
-                    logging.warn("Waiting for ssh to be available on %s: %s", instance.name, exc.output)
-                    nb_try += 1
-                    if nb_try > 10:
-                        logging.critical("No available ssh on %s OpenStack clean up is required", instance.name)
-                        sys.exit(1)
-                    time.sleep(2)
-            logging.debug("ssh available on %s", instance.name)
-
-    def update_etc_hosts(self, instances):
-        """
-        Update /etc/hosts file on each instances.
-        Add each instance name and ip address inside it.
+        cmd = _ssh_cmd(instance.name, 'true')
+        success = False
+        nb_try = 0
+        while not success:
+            try:
+                _check_ssh_output(cmd)
+                success = True
+            except subprocess.CalledProcessError as exc:
+                logging.warn("Waiting for ssh to be available on %s: %s", instance.name, exc.output)
+                nb_try += 1
+                if nb_try > 10:
+                    logging.critical("No available ssh on %s OpenStack clean up is required", instance.name)
+                    sys.exit(1)
+                time.sleep(2)
+        logging.debug("ssh available on %s", instance.name)
+
+    def build_etc_hosts(self, instances):
+        """
+        Return /etc/hosts entries for all instances
         """
         hostfile_tpl = "{ip}    {host}\n"
 
@@ -396,15 +532,23 @@ class CloudManager(object):
             # Collect IP adresses
             fixed_ip = instance.networks[self.network_name][0]
             hostfile += hostfile_tpl.format(host=instance.name, ip=fixed_ip)
+        return hostfile
 
-        for instance in instances:
-            cmd = ['ssh', '-t', '-F', './ssh_config', instance.name,
-                   'sudo sh -c "echo \'{hostfile}\' >> /etc/hosts"'.format(hostfile=hostfile)]
-            try:
-                subprocess.check_output(cmd)
-            except subprocess.CalledProcessError as exc:
-                logging.error("ERROR while updating /etc/hosts: %s", exc.output)
-                sys.exit(1)
+    def update_instance_etc_hosts(self, instance, hostfile):
+        """
+        Set instance hostname to its current name, which might have changed
+        since boot, and add hostfile entries to its /etc/hosts file,
+        using a single ssh session
+        """
+        cmd = _ssh_cmd(instance.name,
+                       'sudo sh -c "hostnamectl set-hostname {host} && '
+                       'echo \'{hostfile}\' >> /etc/hosts"'.format(host=instance.name,
+                                                                   hostfile=hostfile))
+        try:
+            _check_ssh_output(cmd)
+        except subprocess.CalledProcessError as exc:
+            logging.error("ERROR while updating /etc/hosts: %s", exc.output)
+            sys.exit(1)
 
     def build_cloudconfig(self, server_profile=DOCKER_NODE, instance_last_id=""):
         """
@@ -6,7 +6,7 @@ in OpenStack infrastructure, and use cloud config to create users
 on virtual machines
 
 Script performs these tasks:
-  - launch instances from image and manage ssh key
+  - launch instances from image and manage ssh key, in parallel
   - create gateway vm
   - check for available floating ip address
   - add it to gateway
@@ -21,103 +21,138 @@ Script performs these tasks:
 #  Imports of standard modules --
 # -------------------------------
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import subprocess
 import sys
+import threading
 
 # ----------------------------
 # Imports for other modules --
 # ----------------------------
-from novaclient.exceptions import BadRequest
 import cloudmanager
 
+# ---------------------------------
+# Local non-exported definitions --
+# ---------------------------------
+
+# Maximum number of threads used to manage instances in parallel,
+# all related tasks are I/O-bound (Openstack API calls, ssh)
+_MAX_THREADS = 32
+
+def _parallel_map(func, *iterables):
+    """
+    Apply func to each set of items of iterables in a thread pool,
+    and return results list, in the same order as input items
+    """
+    items = list(zip(*iterables))
+    if not items:
+        return []
+    nb_threads = min(_MAX_THREADS, len(items))
+    with ThreadPoolExecutor(max_workers=nb_threads) as executor:
+        futures = [executor.submit(func, *item) for item in items]
+        return [future.result() for future in futures]
+
 # -----------------------
 # Exported definitions --
 # -----------------------
 
 def main():
 
-    userdata_node = cloudManager.build_cloudconfig(cloudmanager.SWARM_NODE)
+    from neutronclient.common.exceptions import NeutronClientException
 
-    # Create instances list
-    instances = []
+    userdata_node = cloudManager.build_cloudconfig(cloudmanager.SWARM_NODE)
 
     if args.cleanup:
-        cloudManager.nova_servers_cleanup(args.nbServers)
-
-    # Create gateway instance and add floating_ip to it
-    gateway_id = 0
-    gateway_instance = cloudManager.nova_servers_create(gateway_id,
-                                                        userdata_node)
+        # Keep one floating ip, it is reused for the new gateway
+        cloudManager.nova_servers_cleanup(args.nbServers,
+                                          release_floating_ips=args.releaseFloatingIps,
+                                          keep_floating_ips=1)
 
-    # Find a floating ip address for gateway
-    floating_ip = cloudManager.get_floating_ip()
-    if not floating_ip:
-        logging.critical("Unable to add public ip to Qserv gateway")
-        sys.exit(1)
-    logging.info("Add floating ip ({0}) to {1}".format(floating_ip,
-                                                       gateway_instance.name))
+    # Create gateway (id: 0), worker and swarm instances
+    userdata_swarm_mgr = cloudManager.build_cloudconfig(cloudmanager.SWARM_MANAGER,
+                                                        args.nbServers-1)
+    node_ids = list(range(args.nbServers))
+
+    # Limit the number of instances booted simultaneously, in order to
+    # respect Openstack rate limits: gateway and workers are booted by
+    # batches of at most args.parallelism instances, with one Nova request
+    # per batch, and each batch holds one slot per instance until it is active
+    boot_slots = threading.BoundedSemaphore(args.parallelism)
+    boot_lock = threading.Lock()
+
+    def _create(instance_ids, userdata):
+        # slots are reserved under lock, to avoid deadlocks between
+        # batches holding part of their slots
+        with boot_lock:
+            for _ in instance_ids:
+                boot_slots.acquire()
+        try:
+            return cloudManager.nova_servers_create_bulk(instance_ids, userdata)
+        finally:
+            for _ in instance_ids:
+                boot_slots.release()
+
+    batches = [node_ids[i:i+args.parallelism]
+               for i in range(0, len(node_ids), args.parallelism)]
+    batches.append(['swarm'])
+    userdatas = [userdata_node] * (len(batches) - 1) + [userdata_swarm_mgr]
+    instances = [instance
+                 for batch in _parallel_map(_create, batches, userdatas)
+                 for instance in batch]
+    swarm_instance = instances[-1]
+    gateway_instance = instances[0]
+
+    # Associate a floating ip address to gateway
     try:
-        gateway_instance.add_floating_ip(floating_ip)
-    except BadRequest as exc:
+        floating_ip = cloudManager.get_floating_ip(gateway_instance)
+    except NeutronClientException as exc:
         logging.critical('The procedure needs to be restarted. '
                          'Exception occurred: %s', exc)
         gateway_instance.delete()
         sys.exit(1)
+    logging.info("Floating ip ({0}) added to {1}".format(floating_ip['floating_ip_address'],
+                                                          gateway_instance.name))
 
     # Manage ssh security group
     if cloudManager.ssh_security_group:
         gateway_instance.add_security_group(cloudManager.ssh_security_group)
 
-    instances.append(gateway_instance)
-
-    # Create worker instances
-    for instance_id in range(1, args.nbServers):
-        worker_instance = cloudManager.nova_servers_create(instance_id,
-                                                           userdata_node)
-        instances.append(worker_instance)
-
-    instance_id = 'swarm'
-    userdata_swarm_mgr = cloudManager.build_cloudconfig(cloudmanager.SWARM_MANAGER,
-                                                        args.nbServers-1)
-    swarm_instance = cloudManager.nova_servers_create(instance_id,
-                                                      userdata_swarm_mgr)
-    instances.append(swarm_instance)
-
     envfile_tpl = '''# Parameters related to Openstack instructure
 # WARN: automatically generated by provisionning script, do not edit
 
-SWARM_NODE="{}"
+SWARM_NODE="{swarm_node}"
 
 # Used by shmux
-HOSTNAME_TPL="{}"
-WORKER_LAST_ID="{}"
-
-printf -v MASTER "%s0" "$HOSTNAME_TPL"
+HOSTNAME_TPL="{hostname_tpl}"
+WORKER_LAST_ID="{worker_last_id}"
 
-for i in $(seq 1 "$WORKER_LAST_ID");
-do
-    printf -v WORKERS "%s %s%s" "$WORKERS" "$HOSTNAME_TPL" "$i"
-done
+MASTER="{master}"
+WORKERS="{workers}"
 '''
 
+    hostname_tpl = cloudManager.get_hostname_tpl()
     worker_last_id = args.nbServers - 1
-    envfile = envfile_tpl.format(swarm_instance.name,
-                                 cloudManager.get_hostname_tpl(),
-                                 worker_last_id)
-    filep = open('env-infrastructure.sh', 'w')
-    filep.write(envfile)
-    filep.close()
+    workers = ' '.join('{0}{1}'.format(hostname_tpl, i)
+                       for i in range(1, worker_last_id + 1))
+    envfile = envfile_tpl.format(swarm_node=swarm_instance.name,
+                                 hostname_tpl=hostname_tpl,
+                                 worker_last_id=worker_last_id,
+                                 master='{0}0'.format(hostname_tpl),
+                                 workers=workers)
+    with open('env-infrastructure.sh', 'w') as filep:
+        filep.write(envfile)
 
     cloudManager.print_ssh_config(instances, floating_ip)
 
     # Wait for cloud config completion for all machines
-    for instance in instances:
-        cloudManager.detect_end_cloud_config(instance)
+    _parallel_map(cloudManager.detect_end_cloud_config, instances)
 
-    cloudManager.check_ssh_up(instances)
+    _parallel_map(cloudManager.check_instance_ssh_up, instances)
 
-    cloudManager.update_etc_hosts(instances)
+    hostfile = cloudManager.build_etc_hosts(instances)
+    _parallel_map(cloudManager.update_instance_etc_hosts,
+                  instances, [hostfile] * len(instances))
 
     logging.debug("SUCCESS: Qserv Openstack cluster is up")
 
@@ -129,9 +164,24 @@ if __name__ == "__main__":
         parser.add_argument('-n', '--nb-servers', dest='nbServers',
                             required=False, default=3, type=int,
                             help='Choose the number of servers to boot')
+        parser.add_argument('-p', '--parallelism', dest='parallelism',
+                            required=False, default=10, type=int,
+                            help='Maximum number of instances booted simultaneously, '
+                                 'gateway and workers are booted by batches of this '
+                                 'size with one Nova request per batch. Openstack '
+                                 'providers usually throttle above 10 simultaneous boots')
+        parser.add_argument('-r', '--release-floating-ips', dest='releaseFloatingIps',
+                            default=False, action='store_true',
+                            help='Deallocate floating ip addresses of instances '
+                                 'deleted during cleanup, except one which is reused '
+                                 'for the new gateway, requires --cleanup')
 
         cloudmanager.add_parser_args(parser)
         args = parser.parse_args()
+        if args.parallelism < 1:
+            parser.error("--parallelism must be a positive integer")
+        if args.releaseFloatingIps and not args.cleanup:
+            parser.error("--release-floating-ips requires --cleanup")
 
         loggerName = "Provisioner"
         cloudmanager.config_logger(loggerName, args.verbose, args.verboseAll)
@@ -105,14 +105,14 @@ class _MPEncoder(object):
                     currentBuf.write('\r\n'.encode(self._encoding))
                 else:
                     currentBuf.seek(0)
-                    result += [currentBuf]
-                    result += [data]
+                    result.append(currentBuf)
+                    result.append(data)
                     currentBuf = io.BytesIO()
                     currentBuf.write('\r\n'.encode(self._encoding))
 
         if currentBuf is not None:
             currentBuf.seek(0)
-            result += [currentBuf]
+            result.append(currentBuf)
 
         return result
 
@@ -621,6 +621,21 @@ class WmgrClient(object):
                 raise
 
 
+    def xrootdRegisterDbs(self, dbNames, restart=True):
+        """
+        Register several new databases with xrootd, xrootd is restarted
+        only once for all of them.
+
+        @param dbNames:  List of new database names
+        @param restart:  If true then xrootd will be restarted
+
+        @raise ClientException: in case of problems
+        """
+        _log.debug('register databases in xrootd: %s', dbNames)
+        data = dict(db=list(dbNames), xrootdRestart=str(int(restart)))
+        self._requestJSON('xrootd', 'dbs/_bulk', method='POST', data=data)
+
+
     def xrootdUnregisterDb(self, dbName, restart=True):
         """
         Remove database from xrootd registration.
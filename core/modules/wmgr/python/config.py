@@ -31,6 +31,7 @@ Module defining Config class and related methods.
 #--------------------------------
 import logging
 import tempfile
+import threading
 
 #-----------------------------
 # Imports for other modules --
@@ -94,11 +95,36 @@ class Config(object):
         # all temporary files will be created in that location
         tempfile.tempdir = self.tmpDir
 
+        # engines are created on first use and shared by all requests,
+        # each engine keeps a pool of connections which are re-used
         self._db = None
         self._dbPriv = None
+        self._dbProxy = None
+        self._lock = threading.Lock()
 
     def dbEngine(self):
         """ Return database engine """
+        with self._lock:
+            if self._db is None:
+                self._db = self._makeDbEngine()
+            return self._db
+
+    def privDbEngine(self):
+        """ Return database engine for priviledged account """
+        with self._lock:
+            if self._dbPriv is None:
+                self._dbPriv = self._makePrivDbEngine()
+            return self._dbPriv
+
+    def proxyDbEngine(self):
+        """ Return database engine for proxy """
+        with self._lock:
+            if self._dbProxy is None:
+                self._dbProxy = self._makeProxyDbEngine()
+            return self._dbProxy
+
+    def _makeDbEngine(self):
+        """ Make new database engine """
         kwargs = {}
         kwargs['query'] = dict(local_infile=1)
         if self.dbHost: kwargs['host'] = self.dbHost
@@ -109,8 +135,8 @@ class Config(object):
         if self.dbPasswd: kwargs['password'] = self.dbPasswd
         return getEngineFromArgs(**kwargs)
 
-    def privDbEngine(self):
-        """ Return database engine for priviledged account """
+    def _makePrivDbEngine(self):
+        """ Make new database engine for priviledged account """
         kwargs = {}
         kwargs['query'] = dict(local_infile=1)
         if self.dbHost: kwargs['host'] = self.dbHost
@@ -121,8 +147,8 @@ class Config(object):
         if self.dbPasswdPriv: kwargs['password'] = self.dbPasswdPriv
         return getEngineFromArgs(**kwargs)
 
-    def proxyDbEngine(self):
-        """ Return database engine for proxy """
+    def _makeProxyDbEngine(self):
+        """ Make new database engine for proxy """
         kwargs = {}
         kwargs['query'] = dict(local_infile=1)
         if self.proxyHost: kwargs['host'] = self.proxyHost
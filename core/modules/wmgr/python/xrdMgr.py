@@ -29,6 +29,7 @@ Module defining Flask blueprint for xrootd management.
 #--------------------------------
 #  Imports of standard modules --
 #--------------------------------
+import itertools
 import logging
 import os
 import re
@@ -39,7 +40,7 @@ import subprocess
 #-----------------------------
 from .config import Config
 from .errors import errorResponse, ExceptionResponse
-from flask import Blueprint, json, request, url_for
+from flask import Blueprint, json, request, Response, stream_with_context, url_for
 from sqlalchemy.exc import SQLAlchemyError
 
 #----------------------------------
@@ -51,17 +52,13 @@ _log = logging.getLogger('xrdMgr')
 # pattern for valid db/table/column names
 _idNameRe = re.compile(r'^[a-zA-Z_][0-9a-zA-Z_]*$')
 
-def _validateId(idType, identifier):
+def _validateDbName(dbName):
     """
-    Validate identifier, throws exception if identifier contains illegal characters
+    Validate database name, throws exception if name contains illegal characters
     """
-    if not _idNameRe.match(identifier):
+    if not _idNameRe.match(dbName):
         raise ExceptionResponse(400, "InvalidArgument",
-                                "{0} name is invalid: '{1}'".format(idType, identifier))
-
-def _validateDbName(dbName):
-    """ Validate database name """
-    return _validateId("Database", dbName)
+                                "Database name is invalid: '{0}'".format(dbName))
 
 def _getArgFlag(mdict, option, default=True):
     """
@@ -81,10 +78,22 @@ def _dbDict(dbName):
     """ Make database instance dict out of db name """
     return dict(name=dbName, uri=url_for('.listChunks', dbName=dbName))
 
+def _dbDicts(dbNames):
+    """ Generate database instance dicts out of db names """
+    # URL map lookup is done only once, with a placeholder for database name,
+    # names are valid identifiers so they do not need quoting
+    placeholder = '_DBNAME_'
+    uriTemplate = url_for('.listChunks', dbName=placeholder)
+    for dbName in dbNames:
+        yield dict(name=dbName, uri=uriTemplate.replace(placeholder, dbName))
+
 def _runCmd(cmd, noexcept=True):
     """ Run command in a subprocess """
     try:
         _log.debug('executing command: %s', cmd)
+        # close_fds has a cost with Python 2 which closes all possible file
+        # descriptors, but it must be kept: init scripts start daemons which
+        # would otherwise inherit our sockets (listening port, db connections)
         subprocess.check_call(cmd, close_fds=True)
         return 0
     except subprocess.CalledProcessError as exc:
@@ -99,14 +108,14 @@ def _restartService(sName):
     _log.info('restarting %s', sName)
     initScript = os.path.join(Config.instance().runDir, 'etc/init.d/'+ sName)
 
-    cmd = [initScript, 'status']
-    if _runCmd(cmd) == 0:
-        try:
-            cmd = [initScript, 'restart']
-            _runCmd(cmd, False)
-        except subprocess.CalledProcessError as exc:
-            raise ExceptionResponse(409, "CommandFailure",
-                                    "Failed to restart %s, please restart it manually" % sName, str(exc))
+    # try-restart checks service status itself, this avoids running
+    # a separate status command before restarting
+    try:
+        cmd = [initScript, 'try-restart']
+        _runCmd(cmd, False)
+    except subprocess.CalledProcessError as exc:
+        raise ExceptionResponse(409, "CommandFailure",
+                                "Failed to restart %s, please restart it manually" % sName, str(exc))
 
 def _restartXrootd():
     _restartService('xrootd')
@@ -135,8 +144,9 @@ def dbs():
 
     _log.debug('request: %s', request)
 
-    # use non-privileged account
-    dbConn = Config.instance().dbEngine().connect()
+    # use non-privileged account, server-side cursor avoids buffering
+    # whole result set before we iterate over it
+    dbConn = Config.instance().dbEngine().connect().execution_options(stream_results=True)
 
     # TODO: Make sure that database name that we use here is correct.
     # The database name that holds Dbs table is constructed from the
@@ -144,14 +154,23 @@ def dbs():
     # instance name "worker" (defined in etc/init.d/xrootd)
     dbs = dbConn.execute('SELECT db FROM qservw_worker.Dbs')
 
-    dbs = [row[0] for row in dbs]
-    _log.debug('dbs = %s', dbs)
+    # fetch first row before response is started, so that errors at this
+    # point are still reported by error handler. Errors while fetching next
+    # rows from server-side cursor can only truncate streamed response.
+    firstRow = dbs.fetchone()
+    rows = [] if firstRow is None else itertools.chain([firstRow], dbs)
 
-    dbData = []
-    for dbName in dbs:
-        dbData += [_dbDict(dbName)]
+    # stream response while reading rows from server-side cursor
+    def _generate():
+        yield '{"results": ['
+        for i, dbData in enumerate(_dbDicts(row[0] for row in rows)):
+            _log.debug('db = %s', dbData)
+            if i:
+                yield ', '
+            yield json.dumps(dbData)
+        yield ']}'
 
-    return json.jsonify(results=dbData)
+    return Response(stream_with_context(_generate()), mimetype='application/json')
 
 
 @xrdService.route('/dbs', methods=['POST'])
@@ -183,20 +202,15 @@ def registerDb():
     # as our regular account can only read from qservw_worker
     dbConn = Config.instance().privDbEngine()
 
-    # table is not indexed, to avoid multiple entries check that it's not defined yet
+    # table is not indexed, to avoid multiple entries only insert database
+    # if it's not defined yet, both are done in a single query
     try:
-        query = "SELECT db FROM qservw_worker.Dbs WHERE db='{0}';".format(dbName)
-        dbs = dbConn.execute(query)
-        if dbs.first():
+        query = "INSERT INTO qservw_worker.Dbs (db) SELECT %s FROM DUAL " \
+                "WHERE NOT EXISTS (SELECT db FROM qservw_worker.Dbs WHERE db=%s)"
+        _log.debug('executing: %s for %s', query, dbName)
+        results = dbConn.execute(query, [dbName, dbName])
+        if results.rowcount == 0:
             raise ExceptionResponse(409, "DatabaseExists", "Database %s is already defined" % dbName)
-    except SQLAlchemyError as exc:
-        _log.error('exception when checking qservw_worker.Dbs: %s', exc)
-        raise
-
-    # now add it
-    try:
-        query = "INSERT INTO qservw_worker.Dbs (db) VALUES ('{0}')".format(dbName)
-        dbConn.execute(query)
     except SQLAlchemyError as exc:
         _log.error('exception when adding database %s: %s', dbName, exc)
         raise
@@ -214,6 +228,77 @@ def registerDb():
     return response
 
 
+@xrdService.route('/dbs/_bulk', methods=['POST'])
+def registerDbs():
+    """
+    Register several new databases in xrootd chunk inventory, xrootd is
+    restarted only once for all of them.
+
+    Following parameters are expected to come in a request (in request body
+    with application/x-www-form-urlencoded content like regular form):
+        db: database name (required, can be repeated)
+        xrootdRestart: if set to 'no' then do not restart xrootd
+    """
+
+    _log.debug('request: %s', request)
+    _log.debug('request.form: %s', request.form)
+
+    # get database names from query, skipping duplicates
+    dbNames = []
+    for dbName in request.form.getlist('db'):
+        dbName = dbName.strip()
+        if dbName and dbName not in dbNames:
+            dbNames.append(dbName)
+    if not dbNames:
+        raise ExceptionResponse(400, "MissingArgument", "Database name argument (db) is missing")
+
+    # validate them
+    for dbName in dbNames:
+        _validateDbName(dbName)
+
+    xrootdRestart = _getArgFlag(request.form, 'xrootdRestart', True)
+    _log.debug('xrootdRestart: %s', xrootdRestart)
+
+    # apparently for now we need to use privileged account
+    # as our regular account can only read from qservw_worker
+    dbConn = Config.instance().privDbEngine()
+
+    # table is not indexed, to avoid multiple entries check that none of them is defined yet
+    placeholders = ', '.join(['%s'] * len(dbNames))
+    try:
+        query = "SELECT db FROM qservw_worker.Dbs WHERE db IN ({0})".format(placeholders)
+        _log.debug('executing: %s for %s', query, dbNames)
+        dbs = [row[0] for row in dbConn.execute(query, dbNames)]
+        if dbs:
+            raise ExceptionResponse(409, "DatabaseExists",
+                                    "Databases %s are already defined" % ', '.join(dbs))
+    except SQLAlchemyError as exc:
+        _log.error('exception when checking qservw_worker.Dbs: %s', exc)
+        raise
+
+    # now add all of them in a single query
+    try:
+        placeholders = ', '.join(['(%s)'] * len(dbNames))
+        query = "INSERT INTO qservw_worker.Dbs (db) VALUES {0}".format(placeholders)
+        _log.debug('executing: %s for %s', query, dbNames)
+        dbConn.execute(query, dbNames)
+    except SQLAlchemyError as exc:
+        _log.error('exception when adding databases %s: %s', dbNames, exc)
+        raise
+
+    _log.debug('databases %s added', dbNames)
+
+    # presently we have to restart xrootd to update ChunkInventory
+    if xrootdRestart:
+        _log.info('restarting xrootd after adding databases %s', dbNames)
+        _restartXrootd()
+
+    # return representation for new databases
+    response = json.jsonify(results=list(_dbDicts(dbNames)))
+    response.status_code = 201
+    return response
+
+
 @xrdService.route('/dbs/<dbName>', methods=['DELETE'])
 def unregisterDb(dbName):
     """